@@ -7,10 +7,17 @@ Cloudflare Cron または GitHub Actions から実行する想定。
 import os
 import re
 import sys
-from config import DISCORD_WEBHOOK_URL_30M, GLM_API_KEY
+from config import GLM_API_KEY
 from rss_fetcher import get_recent_news_30m, get_news, is_important_for_source
-from discord_webhook import send_30m
-from glm_formatter import translate_title_and_summary
+from discord_webhook import send_fanout
+from glm_formatter import (
+    translate_title_and_summary, set_deadline, format_glm_stats, glm_stats, get_cached_translation,
+)
+from alert_queue import RunBudget, iter_by_priority, load_deferred, save_deferred
+from outbox import Outbox
+from dedup import StoryIndex, collapse_cross_lingual, entry_fingerprint
+from router import load_routes, describe_item, match_routes
+from profiling import profile_run, span
 
 # 重要キーワードに当てはまるものだけ送る（1=速報は重要ニュースのみ推奨）
 IMPORTANT_ONLY = int(os.environ.get("ALERT_30M_IMPORTANT_ONLY", "1"))
@@ -18,6 +25,12 @@ IMPORTANT_ONLY = int(os.environ.get("ALERT_30M_IMPORTANT_ONLY", "1"))
 SUMMARY_MAX_CHARS = int(os.environ.get("ALERT_30M_SUMMARY_CHARS", "120"))
 # 取得する時間範囲（分）- テスト時は長めに設定可能
 ALERT_MINUTES = int(os.environ.get("ALERT_30M_MINUTES", "30"))
+# 1回の実行あたりの予算（0=無制限）: GLM呼び出し数・Discord送信数・経過時間（秒）
+MAX_GLM_CALLS = int(os.environ.get("ALERT_30M_MAX_GLM_CALLS", "15"))
+MAX_MESSAGES = int(os.environ.get("ALERT_30M_MAX_MESSAGES", "30"))
+MAX_SECONDS = int(os.environ.get("ALERT_30M_MAX_SECONDS", "1200"))
+# 予算超過分の扱い: plain=翻訳なしでそのまま送信 / defer=次回の実行に回す
+OVERFLOW_POLICY = os.environ.get("ALERT_30M_OVERFLOW", "plain").strip().lower()
 
 
 def _strip_html(text):
@@ -57,96 +70,206 @@ def _save_posted_links(filepath, new_urls, max_lines=800):
         f.write("\n".join(lines) + ("\n" if lines else ""))
 
 
+def _format_message(title, summary, url, comment='', impact_score=0, sentiment='', urgency=''):
+    """速報1件分のメッセージを構築"""
+    msg_parts = [f"⚡速報⚡", f"**{title}**"]
+
+    if summary:
+        msg_parts.append(summary)
+
+    # コメントを追加（1行空けて）
+    if comment:
+        msg_parts.append("")  # 空行
+        msg_parts.append(comment)
+
+    # インパクト分析を追加（1行空けて）
+    if impact_score > 0:
+        msg_parts.append("")  # 空行
+        # 影響度スコアを⭐で表示
+        stars = "⭐" * impact_score + "☆" * (5 - impact_score)
+        analysis_parts = [
+            "📊 インパクト分析",
+            f"・影響度: {stars}"
+        ]
+
+        # センチメントを絵文字付きで表示
+        if sentiment:
+            sentiment_emoji = {
+                'ポジティブ': '📈',
+                '中立': '➡️',
+                'ネガティブ': '📉'
+            }.get(sentiment, '')
+            analysis_parts.append(f"・センチメント: {sentiment_emoji} {sentiment}")
+
+        # 緊急度を絵文字付きで表示
+        if urgency:
+            urgency_emoji = {
+                '高': '🔥',
+                '中': '⚡',
+                '低': '💡'
+            }.get(urgency, '')
+            analysis_parts.append(f"・緊急度: {urgency_emoji} {urgency}")
+
+        msg_parts.append("\n".join(analysis_parts))
+
+    msg_parts.append(url)
+    return "\n".join(msg_parts)
+
+
 def main():
-    if not DISCORD_WEBHOOK_URL_30M:
-        print("DISCORD_WEBHOOK_URL_30M が未設定です", file=sys.stderr)
+    routes = load_routes()
+    if not routes:
+        print("DISCORD_WEBHOOK_URL_30M（または DISCORD_ROUTES）が未設定です", file=sys.stderr)
         sys.exit(1)
+    webhooks = {r["name"]: r["webhook"] for r in routes}
     posted_file = os.environ.get("POSTED_LINKS_FILE", ".cache/posted_links_30m.txt")
+    deferred_file = os.environ.get("DEFERRED_FILE", ".cache/deferred_30m.json")
+    outbox = Outbox(os.environ.get("OUTBOX_FILE", ".cache/outbox_30m.jsonl"))
+    stories_file = os.environ.get("STORIES_FILE", ".cache/stories_30m.json")
+    stories = StoryIndex.load(stories_file)
+    # 前回の実行で送信済み（ack 済み）なのに記録されていない分を反映し、期限切れの未送信分を捨てる
+    if outbox.acked_links():
+        _save_posted_links(posted_file, outbox.acked_links())
+    outbox.compact()
     posted = _load_posted_links(posted_file)
-    
+    resumed = outbox.pending()
+    if resumed:
+        print(f"[INFO] 前回未送信のメッセージを再送します: {len(resumed)}件")
+    budget = RunBudget(MAX_GLM_CALLS, MAX_MESSAGES, MAX_SECONDS)
+    # 再送分も、それぞれの送信先の送信枠に含める（失敗し続ける送信先が他の送信先の枠を使わないように）
+    budget.use_message([r["route"] for r in resumed])
+    # GLM の各呼び出しにも同じ締め切りを適用（間に合わないものは未翻訳で送る）
+    set_deadline(MAX_SECONDS)
+
     # 時間範囲を環境変数で指定可能に（デフォルト30分）
     print(f"[INFO] 過去{ALERT_MINUTES}分のニュースを取得中...")
-    items = get_news(minutes=ALERT_MINUTES)
-    if IMPORTANT_ONLY:
-        items = [e for e in items if is_important_for_source(e.title or "", getattr(e, '_source_url', ''))]
-    items = [e for e in items if e.link not in posted]
+    with span("fetch"):
+        items = get_news(minutes=ALERT_MINUTES)
+    with span("filter"):
+        if IMPORTANT_ONLY:
+            items = [e for e in items if is_important_for_source(e.title or "", getattr(e, '_source_url', ''))]
+        # 前回見送った分を合流（同じリンクは今回取得分を優先）
+        links = {e.link for e in items}
+        items += [e for e in load_deferred(deferred_file) if e.link not in links]
+        # 送信済み・アウトボックスで送信待ちのものは除外（再翻訳しない）
+        pending_links = {r["link"] for r in resumed}
+        items = [e for e in items if e.link not in posted and e.link not in pending_links]
+    # 英日など言語違いの同じ記事は、重要度フィルタを通ったものの中で1件にまとめる
+    # （日本語版を優先し、過去の実行で送った記事の別言語版も除く）
+    with span("dedup"):
+        before = len(items)
+        items = collapse_cross_lingual(items, history=stories)
+    if before > len(items):
+        print(f"[INFO] 言語違いの重複を除外: {before - len(items)}件")
     print(f"[INFO] 対象ニュース: {len(items)}件")
-    if not items:
+    if not items and not resumed:
+        save_deferred(deferred_file, [])
         print(f"送信対象の新着重要ニュースはありません（過去{ALERT_MINUTES}分・未送信のみ）")
         return
-    # 各ニュースを個別メッセージとして送信
-    messages = []
-    for e in items:
+    # 優先度の高い順に処理し、予算を超えた分は素のまま送るか次回に回す
+    records = []
+    deferred = []
+    unrouted = []
+    skipped = 0
+    for e in iter_by_priority(items):
+        # どのルールにも当たりえない記事は GLM を使わずに送信済み扱いにする
+        candidates = match_routes(routes, describe_item(e, e.title or ""), prefilter=True)
+        if not candidates:
+            unrouted.append(e.link)
+            continue
+        if not budget.room(candidates):
+            deferred.append(e)
+            continue
         title = e.title or "(タイトルなし)"
         summary = _get_summary(e, SUMMARY_MAX_CHARS)
-        url = e.link
-
-        # 英語の場合は日本語に翻訳＋コメント・分析を生成（GLM_API_KEY が設定されている場合のみ）
-        if GLM_API_KEY:
-            result = translate_title_and_summary(title, summary)
-            title = result['title']
-            summary = result['summary']
-            comment = result['comment']
-            impact_score = result['impact_score']
-            sentiment = result['sentiment']
-            urgency = result['urgency']
+
+        # 英語の場合は日本語に翻訳＋コメント・分析を生成（GLM_API_KEY が設定され、予算が残っている場合のみ）
+        # キャッシュ済みの翻訳は予算に関係なく使い、実際に GLM へ送ったリクエスト数（ヘッジを含む）だけ予算から引く
+        if GLM_API_KEY and (get_cached_translation(title) or budget.can_use_glm()):
+            requests_before = glm_stats()["requests"]
+            with span("enrich"):
+                result = translate_title_and_summary(title, summary)
+            budget.use_glm(glm_stats()["requests"] - requests_before)
+            item = describe_item(e, result['title'], result['impact_score'])
+            msg = _format_message(
+                result['title'], result['summary'], e.link,
+                comment=result['comment'],
+                impact_score=result['impact_score'],
+                sentiment=result['sentiment'],
+                urgency=result['urgency'],
+            )
+        elif GLM_API_KEY and OVERFLOW_POLICY == "defer":
+            deferred.append(e)
+            continue
         else:
-            comment = ''
-            impact_score = 0
-            sentiment = ''
-            urgency = ''
-
-        # メッセージを構築
-        msg_parts = [f"⚡速報⚡", f"**{title}**"]
-
-        if summary:
-            msg_parts.append(summary)
-
-        # コメントを追加（1行空けて）
-        if comment:
-            msg_parts.append("")  # 空行
-            msg_parts.append(comment)
-
-        # インパクト分析を追加（1行空けて）
-        if impact_score > 0:
-            msg_parts.append("")  # 空行
-            # 影響度スコアを⭐で表示
-            stars = "⭐" * impact_score + "☆" * (5 - impact_score)
-            analysis_parts = [
-                "📊 インパクト分析",
-                f"・影響度: {stars}"
-            ]
-
-            # センチメントを絵文字付きで表示
-            if sentiment:
-                sentiment_emoji = {
-                    'ポジティブ': '📈',
-                    '中立': '➡️',
-                    'ネガティブ': '📉'
-                }.get(sentiment, '')
-                analysis_parts.append(f"・センチメント: {sentiment_emoji} {sentiment}")
-
-            # 緊急度を絵文字付きで表示
-            if urgency:
-                urgency_emoji = {
-                    '高': '🔥',
-                    '中': '⚡',
-                    '低': '💡'
-                }.get(urgency, '')
-                analysis_parts.append(f"・緊急度: {urgency_emoji} {urgency}")
-
-            msg_parts.append("\n".join(analysis_parts))
-
-        msg_parts.append(url)
-        msg = "\n".join(msg_parts)
-        messages.append(msg)
-    ok, err = send_30m(messages)
-    if not ok:
-        print(f"送信失敗: {err}", file=sys.stderr)
-        sys.exit(1)
-    new_urls = [e.link for e in items]
+            item = describe_item(e, title)
+            msg = _format_message(title, summary, e.link)
+        # 整形は1回だけ行い、条件に合う送信先ごとにメッセージを作る
+        matched = match_routes(routes, item)
+        if not matched:
+            unrouted.append(e.link)
+            continue
+        # 送信枠の残っている送信先にだけ送る。どこにも枠がなければ次回へ（翻訳はキャッシュされるので再翻訳しない）
+        allowed = budget.room(matched)
+        if not allowed:
+            deferred.append(e)
+            continue
+        skipped += len(matched) - len(allowed)
+        for name in allowed:
+            records.append({"id": f"{name}:{e.link}", "route": name, "link": e.link, "content": msg})
+        budget.use_message(allowed)
+    print(f"[INFO] 予算: {budget.describe()}（見送り {len(deferred)}件・送信先なし {len(unrouted)}件"
+          f"・送信枠超過で一部の送信先を省略 {skipped}件）")
+    if GLM_API_KEY:
+        print(f"[INFO] GLM: {format_glm_stats()}")
+    save_deferred(deferred_file, deferred)
+    if unrouted:
+        _save_posted_links(posted_file, unrouted)
+    # 送信前にアウトボックスへ保存し、1件送れるごとに ack する
+    outbox.add(records)
+    pending = outbox.pending()
+    for r in pending:
+        # 設定から消えた送信先宛ての未送信分は破棄する
+        if r["route"] not in webhooks:
+            print(f"[WARN] 送信先 '{r['route']}' が見つからないため破棄: {r['link']}", file=sys.stderr)
+            outbox.ack(r["id"])
+    pending = [r for r in pending if r["route"] in webhooks]
+    if not pending:
+        _save_posted_links(posted_file, outbox.acked_links())
+        outbox.compact()
+        print("予算内で送信できるニュースはありませんでした（次回に持ち越し）")
+        return
+    # 送信先ごとに並列送信（各 Webhook のレート制限は独立して処理）
+    by_url = {}
+    for r in pending:
+        by_url.setdefault(webhooks[r["route"]], []).append(r)
+    with span("send"):
+        errors = send_fanout(
+            {url: [r["content"] for r in rs] for url, rs in by_url.items()},
+            on_sent=lambda url, i: outbox.ack(by_url[url][i]["id"]),
+        )
+    # 送れなかった分は失敗回数を数え、上限に達したら次回の compact で捨てる
+    outbox.mark_failed([r["id"] for r in pending])
+    new_urls = outbox.acked_links()
     _save_posted_links(posted_file, new_urls)
-    print(f"送信完了: {len(items)}件（送信済みリストを更新しました）")
+    # 送信できた記事の特徴を保存し、後から届く別言語版の判定に使う
+    by_link = {e.link: e for e in items}
+    for link in new_urls:
+        if link in by_link:
+            language, features = entry_fingerprint(by_link[link])
+            stories.add(language, features, link)
+    stories.save(stories_file)
+    outbox.compact()
+    failed = {url: err for url, err in errors.items() if err}
+    if failed:
+        names = [name for name, url in webhooks.items() if url in failed]
+        print(f"送信失敗: {', '.join(names)}: {'; '.join(failed.values())}"
+              f"（残り{len(outbox.pending())}件は次回再送）", file=sys.stderr)
+        sys.exit(1)
+    print(f"送信完了: {len(new_urls)}件・{len(pending)}メッセージ（送信先 {len(by_url)}件）")
+
 
 if __name__ == "__main__":
-    main()
+    # --profile または BOT_PROFILE=1 でプロファイルを .profile/ に出力
+    with profile_run("alert_30m"):
+        main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+速報の優先度付きキューと1回の実行あたりの予算管理（30分Bot用）
+スコア = キーワード重み + ソース種別ボーナス + 新しさボーナス
+"""
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import feedparser
+
+from config import IMPORTANT_KEYWORDS, KEYWORD_WEIGHTS
+from rss_fetcher import _is_crypto_media, _parse_published
+
+# 暗号資産専門メディアへの加点（CRYPTO_MEDIA_KEYWORDS で判定）
+CRYPTO_MEDIA_BONUS = float(os.environ.get("ALERT_30M_CRYPTO_MEDIA_BONUS", "1"))
+# 新しさボーナス（最大1点）が半分になるまでの分数
+RECENCY_HALF_LIFE_MINUTES = float(os.environ.get("ALERT_30M_RECENCY_HALF_LIFE", "30"))
+
+
+def keyword_score(text):
+    """キーワード重みの合計（大文字小文字無視）"""
+    if not text:
+        return 0
+    text_lower = text.lower()
+    return sum(KEYWORD_WEIGHTS.get(k, 1) for k in IMPORTANT_KEYWORDS if k.lower() in text_lower)
+
+
+def score_entry(entry, now=None):
+    """エントリの優先度スコア（大きいほど先に処理）"""
+    now = now or datetime.now(timezone.utc)
+    score = float(keyword_score(entry.title or ""))
+    if _is_crypto_media(getattr(entry, '_source_url', '')):
+        score += CRYPTO_MEDIA_BONUS
+    age_minutes = max((now - _parse_published(entry)).total_seconds() / 60, 0)
+    score += 0.5 ** (age_minutes / RECENCY_HALF_LIFE_MINUTES)
+    return score
+
+
+def iter_by_priority(entries, now=None):
+    """スコアの高い順にエントリを返す（同点なら元の順序＝新しい順）。"""
+    now = now or datetime.now(timezone.utc)
+    heap = [(-score_entry(e, now), i, e) for i, e in enumerate(entries)]
+    heapq.heapify(heap)
+    while heap:
+        _, _, entry = heapq.heappop(heap)
+        yield entry
+
+
+class RunBudget:
+    """
+    1回の実行で使ってよい GLM 呼び出し数・Discord 送信数・経過時間（秒）。
+    送信数は送信先（ルール名）ごとに数え、上限も送信先ごとに適用する
+    （レート制限も失敗も送信先ごとに独立するため、ある送信先の再送待ちが他の送信先の枠を使わない）。
+    いずれも 0 以下なら無制限。
+    """
+
+    def __init__(self, max_glm_calls=0, max_messages=0, max_seconds=0):
+        self.max_glm_calls = max_glm_calls
+        self.max_messages = max_messages
+        self.max_seconds = max_seconds
+        self.glm_calls = 0
+        self.messages = {}  # 送信先 -> 件数
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def has_time(self):
+        return self.max_seconds <= 0 or self.elapsed() < self.max_seconds
+
+    def can_use_glm(self):
+        """GLM 呼び出し枠と時間が残っているか"""
+        if self.max_glm_calls > 0 and self.glm_calls >= self.max_glm_calls:
+            return False
+        return self.has_time()
+
+    def room(self, routes):
+        """routes のうち、まだ送信枠が残っている送信先"""
+        if self.max_messages <= 0:
+            return list(routes)
+        return [r for r in routes if self.messages.get(r, 0) < self.max_messages]
+
+    def use_glm(self, count=1):
+        self.glm_calls += count
+
+    def use_message(self, routes):
+        """routes の各送信先に1件ずつ送る分を使う"""
+        for r in routes:
+            self.messages[r] = self.messages.get(r, 0) + 1
+
+    def describe(self):
+        def _limit(n):
+            return str(n) if n > 0 else "∞"
+        return (f"GLM {self.glm_calls}/{_limit(self.max_glm_calls)}, "
+                f"送信 {sum(self.messages.values())}（送信先ごと上限 {_limit(self.max_messages)}）, "
+                f"経過 {self.elapsed():.0f}s/{_limit(self.max_seconds)}s")
+
+
+def load_deferred(filepath, max_age_hours=6):
+    """前回の実行で予算超過により見送ったエントリを読み込む（古すぎるものは捨てる）。"""
+    if not filepath or not os.path.exists(filepath):
+        return []
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return []
+    cutoff = time.time() - max_age_hours * 3600
+    entries = []
+    for r in records:
+        if not r.get("link") or r.get("published", 0) < cutoff:
+            continue
+        entry = feedparser.FeedParserDict(
+            title=r.get("title", ""),
+            link=r["link"],
+            summary=r.get("summary", ""),
+            published_parsed=time.gmtime(r["published"]),
+        )
+        entry._source_url = r.get("source_url", "")
+        entries.append(entry)
+    return entries
+
+
+def save_deferred(filepath, entries):
+    """見送ったエントリを次回の実行に持ち越す（空なら空リストで上書き）。"""
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    records = [
+        {
+            "title": e.title or "",
+            "link": e.link,
+            "summary": getattr(e, 'summary', '') or getattr(e, 'description', '') or '',
+            "source_url": getattr(e, '_source_url', ''),
+            "published": _parse_published(e).timestamp(),
+        }
+        for e in entries
+    ]
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
@@ -10,10 +10,19 @@ DISCORD_WEBHOOK_URL_DAILY = os.environ.get("DISCORD_WEBHOOK_URL_DAILY", "").stri
 
 # 30分Bot用・日次まとめBot用で同じWebhookでも可（未設定ならそのBotは送信スキップ）
 
+# 30分Botの振り分けルール（JSON配列。未設定なら DISCORD_WEBHOOK_URL_30M に全件送信）
+# 例: [{"name": "macro", "webhook": "https://discord.com/api/webhooks/...", "source": "general", "min_impact": 3},
+#      {"name": "regulation", "webhook": "https://...", "keywords": ["SEC", "規制"], "language": "ja"}]
+# source: crypto / general、keywords: いずれかを含む、min_impact: GLM影響度の下限、language: ja / en（元記事の言語）
+DISCORD_ROUTES = os.environ.get("DISCORD_ROUTES", "").strip()
+
 # GLM API（日次まとめの整形用・任意）
 GLM_API_KEY = os.environ.get("GLM_API_KEY", "").strip()
 GLM_API_URL = os.environ.get("GLM_API_URL", "https://api.z.ai/api/paas/v4/chat/completions").strip()
 GLM_MODEL = os.environ.get("GLM_MODEL", "glm-4-flash")  # 無料: glm-4-flash, glm-4.7-flash
+# ヘッジ（応答が遅いときに並行して送る2本目）の送信先。未設定なら上と同じ
+GLM_HEDGE_API_URL = os.environ.get("GLM_HEDGE_API_URL", "").strip() or GLM_API_URL
+GLM_HEDGE_MODEL = os.environ.get("GLM_HEDGE_MODEL", "").strip() or GLM_MODEL
 
 # 日次まとめでGLMを使うか（GLM_API_KEY が設定されていれば使用）
 USE_GLM_FOR_DAILY = os.environ.get("USE_GLM_FOR_DAILY", "0").strip().lower() in ("1", "true", "yes")
@@ -43,3 +52,41 @@ IMPORTANT_KEYWORDS = [
     "SEC", "ETF", "訴訟", "規制", "禁止", "制限",
     "暗号資産", "仮想通貨", "暗号通貨", "ビットコイン", "イーサリアム", "取引所",
 ]
+
+# 速報の優先度スコア用キーワード重み（未指定のキーワードは 1）
+KEYWORD_WEIGHTS = {
+    "FOMC": 5, "利上げ": 4, "利下げ": 4, "破綻": 4, "暴落": 4, "デフォルト": 4,
+    "緊急": 3, "戦争": 3, "侵攻": 3, "制裁": 3, "SEC": 3, "ETF": 3,
+    "インフレ": 2, "規制": 2, "禁止": 2, "訴訟": 2, "取引所": 2,
+}
+
+# 英日で同じ記事を見分けるための固有名詞の対応表（小文字の表記 → 共通の名前）
+ENTITY_ALIASES = {
+    "bitcoin": "BTC", "ビットコイン": "BTC", "btc": "BTC",
+    "ethereum": "ETH", "イーサリアム": "ETH", "ether": "ETH", "eth": "ETH",
+    "ripple": "XRP", "リップル": "XRP", "xrp": "XRP",
+    "solana": "SOL", "ソラナ": "SOL", "sol": "SOL",
+    "tether": "USDT", "テザー": "USDT", "usdt": "USDT",
+    "stablecoin": "stablecoin", "ステーブルコイン": "stablecoin",
+    "sec": "SEC", "証券取引委員会": "SEC",
+    "etf": "ETF",
+    "fed": "FED", "fomc": "FED", "frb": "FED", "federal reserve": "FED", "連邦準備": "FED",
+    "boj": "BOJ", "日銀": "BOJ", "日本銀行": "BOJ", "bank of japan": "BOJ",
+    "trump": "trump", "トランプ": "trump",
+    "biden": "biden", "バイデン": "biden",
+    "powell": "powell", "パウエル": "powell",
+    "blackrock": "blackrock", "ブラックロック": "blackrock",
+    "binance": "binance", "バイナンス": "binance",
+    "coinbase": "coinbase", "コインベース": "coinbase",
+    "microstrategy": "strategy", "マイクロストラテジー": "strategy", "ストラテジー": "strategy",
+    "grayscale": "grayscale", "グレースケール": "grayscale",
+    "japan": "japan", "日本": "japan",
+    "china": "china", "中国": "china",
+    "russia": "russia", "ロシア": "russia",
+    "ukraine": "ukraine", "ウクライナ": "ukraine",
+}
+# 別名を持たないが固有名詞として扱う大文字のティッカー・略称（これ以外の大文字語は重複判定に使わない）
+KNOWN_TICKERS = {
+    "BNB", "DOGE", "ADA", "TRX", "TON", "AVAX", "DOT", "LTC", "SHIB", "PEPE", "SUI", "USDC",
+    "MSTR", "CFTC", "FTX", "IMF", "ECB",
+}
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+英語版・日本語版など、言語の違う同じ記事の重複判定（30分Bot用）
+タイトルとリンクのパスから言語に依存しない特徴（数値・ティッカー・固有名詞）を取り出し、
+言語の違う記事と特徴が十分に重なれば同じ記事とみなす。
+GLM の翻訳キャッシュがあれば、翻訳後のタイトルからも特徴を取る。
+送信済み記事の特徴はファイルに保存し、後の実行で届いた別言語版も除けるようにする。
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from urllib.parse import unquote, urlsplit
+
+from config import ENTITY_ALIASES, KNOWN_TICKERS
+from glm_formatter import get_cached_translation, _is_mostly_english
+
+# 一致とみなす共通特徴の最小数と、多い側の特徴数に対する割合
+MIN_SHARED_FEATURES = 2
+MIN_OVERLAP_RATIO = 0.6
+# ありふれていて、これだけの一致では同じ記事とはいえない固有名詞・略語
+GENERIC_ENTITIES = {
+    "BTC", "ETH", "ETF", "SEC", "FED", "USDT", "USDC", "stablecoin", "US", "USD",
+    "CEO", "AI", "NFT", "IPO", "DEFI", "CBDC", "DAO", "DEX", "CEX",
+    "japan", "china", "russia", "ukraine",
+}
+# リンクの末尾（スラッグ）の単語の一致を数えるときに無視する語
+_SLUG_STOPWORDS = {"the", "and", "for", "with", "from", "after", "amid", "over", "into", "says", "news", "html"}
+
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+_YEAR_RE = re.compile(r'(?:19|20)\d\d')
+# 大文字のティッカー（複数形 ETFs なども）。ENTITY_ALIASES か KNOWN_TICKERS にあるものだけを使う
+_TICKER_RE = re.compile(r'(?<![A-Za-z])([A-Z]{2,6})s?(?![A-Za-z])')
+# 英字の別名は単語境界で、日本語の別名は部分一致で探す（長いものを優先）
+_ALIAS_RE = re.compile('|'.join(
+    rf'(?<![a-z0-9])({re.escape(alias)})s?(?![a-z0-9])' if alias.isascii() else f'({re.escape(alias)})'
+    for alias in sorted(ENTITY_ALIASES, key=len, reverse=True)
+))
+
+
+def _normalize_number(text):
+    value = text.replace(",", "")
+    if "." in value:
+        value = value.rstrip("0").rstrip(".")
+    return value
+
+
+def canonical_path(link):
+    """リンクのパス（ホスト・クエリ・末尾の / と /amp を除いた小文字）"""
+    if not link:
+        return ""
+    path = urlsplit(link).path.lower().rstrip("/")
+    if path.endswith("/amp"):
+        path = path[:-4]
+    return path
+
+
+def story_features(title, link=""):
+    """言語に依存しない特徴の集合（n:数値 / e:ティッカー・固有名詞）"""
+    slug = canonical_path(link).rsplit("/", 1)[-1].replace("-", " ")
+    text = unicodedata.normalize("NFKC", f"{title or ''} {slug}")
+    features = set()
+    for m in _NUMBER_RE.finditer(text):
+        number = _normalize_number(m.group())
+        # 1桁の数字と西暦はありふれているため使わない
+        if len(number) >= 2 and not _YEAR_RE.fullmatch(number):
+            features.add("n:" + number)
+    for m in _TICKER_RE.finditer(text):
+        ticker = m.group(1)
+        if ticker.lower() in ENTITY_ALIASES:
+            features.add("e:" + ENTITY_ALIASES[ticker.lower()])
+        elif ticker in KNOWN_TICKERS:
+            features.add("e:" + ticker)
+    for m in _ALIAS_RE.finditer(text.lower()):
+        alias = next(g for g in m.groups() if g)
+        features.add("e:" + ENTITY_ALIASES[alias])
+    return features
+
+
+def slug_words(link):
+    """リンクのスラッグに含まれる3文字以上の英単語"""
+    slug = unquote(canonical_path(link).rsplit("/", 1)[-1])
+    return set(re.findall(r'[a-z]{3,}', slug)) - _SLUG_STOPWORDS
+
+
+def entry_fingerprint(entry):
+    """エントリの (言語, 特徴)。翻訳キャッシュがあれば翻訳後タイトルの特徴も加える。"""
+    title = entry.title or ""
+    features = story_features(title, entry.link)
+    cached = get_cached_translation(title)
+    if cached and cached.get('title') and cached['title'] != title:
+        features |= story_features(cached['title'])
+    return ("en" if _is_mostly_english(title) else "ja"), features
+
+
+def _is_same_story(shared, slug_overlap=0):
+    """
+    共通特徴が同じ記事の根拠として十分か。2つ以上の数値の一致か、
+    固有の名前に加えて数値またはリンクのスラッグ（2語以上）の一致を求める。
+    ありふれた固有名詞と価格1つ（例: BTC と 100000）や、名前だけ（例: binance と CEO）では不十分。
+    """
+    numbers = [f for f in shared if f.startswith("n:")]
+    specific = [f for f in shared if f.startswith("e:") and f[2:] not in GENERIC_ENTITIES]
+    if len(numbers) >= 2:
+        return True
+    return bool(specific) and (bool(numbers) or slug_overlap >= 2)
+
+
+class StoryIndex:
+    """
+    記事の特徴の転置インデックス。候補は特徴を共有する記事だけに絞るため、
+    1件あたりの判定は既出件数ではなく共有特徴の数に比例する。
+    """
+
+    def __init__(self):
+        self._stories = []  # {"link", "language", "features", "time"}
+        self._by_feature = defaultdict(list)
+        self._paths = defaultdict(list)
+
+    def find(self, language, features, link=""):
+        """言語が違い、同じ記事とみなせる記事の番号（なければ None）"""
+        path = canonical_path(link)
+        if path.count("/") >= 2:
+            for i in self._paths.get(path, ()):
+                if self._stories[i]["language"] != language:
+                    return i
+        if len(features) < MIN_SHARED_FEATURES:
+            return None
+        words = slug_words(link)
+        shared = defaultdict(set)
+        for feature in features:
+            for i in self._by_feature.get(feature, ()):
+                shared[i].add(feature)
+        for i, common in shared.items():
+            other = self._stories[i]
+            if other["language"] == language:
+                continue  # 同じ言語どうしはタイトルの類似判定に任せる
+            if len(common) < MIN_SHARED_FEATURES:
+                continue
+            if len(common) < MIN_OVERLAP_RATIO * max(len(features), len(other["features"])):
+                continue
+            if _is_same_story(common, len(words & slug_words(other["link"]))):
+                return i
+        return None
+
+    def add(self, language, features, link="", added=None):
+        i = len(self._stories)
+        self._stories.append({
+            "link": link, "language": language, "features": set(features),
+            "time": time.time() if added is None else added,
+        })
+        for feature in features:
+            self._by_feature[feature].append(i)
+        path = canonical_path(link)
+        if path.count("/") >= 2:
+            self._paths[path].append(i)
+        return i
+
+    @classmethod
+    def load(cls, filepath, max_age_hours=24):
+        """保存済みの送信済み記事の特徴を読み込む（古いものは捨てる）。"""
+        index = cls()
+        if not filepath or not os.path.exists(filepath):
+            return index
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return index
+        cutoff = time.time() - max_age_hours * 3600
+        for r in records:
+            if r.get("time", 0) >= cutoff:
+                index.add(r.get("language", ""), r.get("features", []), r.get("link", ""), added=r["time"])
+        return index
+
+    def save(self, filepath, max_items=800):
+        """新しいものから max_items 件を保存"""
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        records = [
+            dict(s, features=sorted(s["features"]))
+            for s in self._stories[-max_items:]
+        ]
+        tmp = filepath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp, filepath)
+
+
+def collapse_cross_lingual(entries, history=None, prefer="ja"):
+    """
+    言語違いの同じ記事を1件にまとめる。重要度フィルタの後に呼ぶこと。
+    - history（送信済み記事の StoryIndex）と一致するものは既に配信済みとして除く
+    - 今回の中のペアは prefer の言語（日本語版＝翻訳不要）を残す
+    戻り値は残すエントリ（元の順序）。
+    """
+    fingerprints = [entry_fingerprint(e) for e in entries]
+    order = sorted(range(len(entries)), key=lambda i: fingerprints[i][0] != prefer)
+    current = StoryIndex()
+    keep = set()
+    for i in order:
+        language, features = fingerprints[i]
+        link = entries[i].link
+        if history is not None and history.find(language, features, link) is not None:
+            continue
+        if current.find(language, features, link) is not None:
+            continue
+        current.add(language, features, link)
+        keep.add(i)
+    return [e for i, e in enumerate(entries) if i in keep]
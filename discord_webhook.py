@@ -3,10 +3,29 @@
 Discord Webhook 送信（Cloudflare / GitHub Actions 用。Botトークン不要）
 """
 import json
+import time
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 
 from config import DISCORD_WEBHOOK_URL_30M, DISCORD_WEBHOOK_URL_DAILY
+from profiling import span
+
+# Discord の制限（https://discord.com/developers/docs/resources/message#embed-object-embed-limits）
+CONTENT_LIMIT = 2000
+EMBEDS_PER_MESSAGE = 10
+EMBED_TITLE_LIMIT = 256
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_FIELDS_LIMIT = 25
+EMBED_FIELD_NAME_LIMIT = 256
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_TOTAL_LIMIT = 6000
+
+# レート制限（429）時の再試行回数と、待機時間の上限（秒）
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_MAX_WAIT = 60
+# 同時に送信する Webhook 数の上限
+MAX_PARALLEL_WEBHOOKS = 8
 
 
 def send_webhook(webhook_url: str, content: str = None, embeds: list = None):
@@ -15,9 +34,9 @@ def send_webhook(webhook_url: str, content: str = None, embeds: list = None):
         return False, "DISCORD_WEBHOOK_URL が未設定です"
     body = {}
     if content:
-        body["content"] = content[:2000]
+        body["content"] = content[:CONTENT_LIMIT]
     if embeds:
-        body["embeds"] = embeds[:10]
+        body["embeds"] = embeds[:EMBEDS_PER_MESSAGE]
     if not body:
         return False, "content または embeds が必要です"
     data = json.dumps(body).encode("utf-8")
@@ -31,39 +50,201 @@ def send_webhook(webhook_url: str, content: str = None, embeds: list = None):
         headers=headers,
         method="POST",
     )
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            with span("send_webhook"), urllib.request.urlopen(req, timeout=30) as res:
+                if 200 <= res.status < 300:
+                    # バケットを使い切ったら、この Webhook の次の送信はリセットまで待つ
+                    if res.headers.get("X-RateLimit-Remaining") == "0":
+                        time.sleep(_header_seconds(res.headers, "X-RateLimit-Reset-After"))
+                    return True, None
+                return False, f"HTTP {res.status}"
+        except urllib.error.HTTPError as e:
+            if e.code == 429 and attempt < RATE_LIMIT_RETRIES:
+                wait = _header_seconds(e.headers, "Retry-After", default=1.0)
+                print(f"[Discord] レート制限: {wait:.1f}秒待機して再送 ({attempt + 1}/{RATE_LIMIT_RETRIES})")
+                time.sleep(wait)
+                continue
+            return False, f"HTTP {e.code}: {e.read().decode()[:200]}"
+        except Exception as e:
+            return False, str(e)
+
+
+def _header_seconds(headers, name, default=0.0):
+    """レート制限ヘッダの秒数（不正値は default、上限は RATE_LIMIT_MAX_WAIT）"""
     try:
-        with urllib.request.urlopen(req, timeout=30) as res:
-            if 200 <= res.status < 300:
-                return True, None
-            return False, f"HTTP {res.status}"
-    except urllib.error.HTTPError as e:
-        return False, f"HTTP {e.code}: {e.read().decode()[:200]}"
-    except Exception as e:
-        return False, str(e)
-
-
-def send_30m(contents: list):
-    """30分Bot用Webhook。複数メッセージは順に送信（Discord制限に合わせて分割可能）。"""
-    url = DISCORD_WEBHOOK_URL_30M
-    if not url:
-        return False, "DISCORD_WEBHOOK_URL_30M が未設定です"
-    for text in contents:
-        ok, err = send_webhook(url, content=text)
+        value = float(headers.get(name) or default)
+    except (TypeError, ValueError):
+        value = default
+    return min(max(value, 0.0), RATE_LIMIT_MAX_WAIT)
+
+
+def split_lines(text: str, limit: int):
+    """
+    text を limit 文字以内のチャンクに分割（行単位で詰め込み、行やURLを途中で切らない）。
+    1行が limit を超える場合のみ、その行を空白位置（なければ limit）で分割する。
+    """
+    chunks = []
+    current = ""
+    for line in (text or "").split("\n"):
+        while len(line) > limit:
+            cut = line.rfind(" ", 0, limit)
+            if cut <= 0:
+                cut = limit
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        if not current:
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current += "\n" + line
+        else:
+            chunks.append(current)
+            current = line
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def _embed_size(embed: dict):
+    """6000文字制限の対象となる文字数（title, description, fields, footer, author）"""
+    size = len(embed.get("title", "")) + len(embed.get("description", ""))
+    for field in embed.get("fields", []):
+        size += len(field.get("name", "")) + len(field.get("value", ""))
+    size += len(embed.get("footer", {}).get("text", ""))
+    size += len(embed.get("author", {}).get("name", ""))
+    return size
+
+
+def _clamp_embed(embed: dict):
+    """各項目を Discord の上限に切り詰め、embed 1つでも合計6000文字を超えないようにして返す。"""
+    embed = dict(embed)
+    if "title" in embed:
+        embed["title"] = embed["title"][:EMBED_TITLE_LIMIT]
+    if "description" in embed:
+        embed["description"] = embed["description"][:EMBED_DESCRIPTION_LIMIT]
+    if "fields" in embed:
+        embed["fields"] = [
+            dict(f, name=f.get("name", "")[:EMBED_FIELD_NAME_LIMIT], value=f.get("value", "")[:EMBED_FIELD_VALUE_LIMIT])
+            for f in embed["fields"][:EMBED_FIELDS_LIMIT]
+        ]
+    # 合計の超過分は description から削り、足りなければ fields を後ろから落とす
+    over = _embed_size(embed) - EMBED_TOTAL_LIMIT
+    if over > 0 and embed.get("description"):
+        cut = min(over, len(embed["description"]))
+        embed["description"] = embed["description"][:len(embed["description"]) - cut]
+        over -= cut
+    while over > 0 and embed.get("fields"):
+        field = embed["fields"].pop()
+        over -= len(field.get("name", "")) + len(field.get("value", ""))
+    return embed
+
+
+def pack_embeds(groups: list):
+    """
+    embed のグループ（1グループ = 1テキスト分）を、順序を保ったまま Webhook 1回分
+    （最大10個・合計6000文字）ずつに詰める。1回分に収まるグループは途中で分けない。
+    1回分に収まらない大きなグループだけは、単独で複数回に分けて送る。
+    戻り値はリクエストごとの [(グループ番号, embed), ...] のリスト。
+    """
+    batches = []
+    batch = []
+    batch_size = 0
+    for owner, group in enumerate(groups):
+        group = [_clamp_embed(embed) for embed in group]
+        sizes = [_embed_size(embed) for embed in group]
+        fits_alone = len(group) <= EMBEDS_PER_MESSAGE and sum(sizes) <= EMBED_TOTAL_LIMIT
+        if batch and (not fits_alone
+                      or len(batch) + len(group) > EMBEDS_PER_MESSAGE
+                      or batch_size + sum(sizes) > EMBED_TOTAL_LIMIT):
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+        for embed, size in zip(group, sizes):
+            if batch and (len(batch) >= EMBEDS_PER_MESSAGE or batch_size + size > EMBED_TOTAL_LIMIT):
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+            batch.append((owner, embed))
+            batch_size += size
+        if not fits_alone and batch:
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def text_to_embeds(text: str, limit: int = EMBED_TOTAL_LIMIT // 2):
+    """
+    テキストを行単位で description に詰めた embed のリストに変換。
+    limit は 6000文字制限の半分（1リクエストに2つ並べて詰められる大きさ）。
+    """
+    return [{"description": part} for part in split_lines(text, min(limit, EMBED_DESCRIPTION_LIMIT))]
+
+
+def send_packed(webhook_url: str, contents: list, on_sent=None):
+    """
+    複数テキストを embed にまとめ、できるだけ少ないリクエスト数で送信。
+    on_sent が指定されていれば、contents[i] の全 embed の送信に成功した時点で on_sent(i) を呼ぶ
+    （空のテキストは送るものがないため最初に呼ぶ）。
+    """
+    groups = [text_to_embeds(text) for text in contents]
+    if on_sent:
+        for i, group in enumerate(groups):
+            if not group:
+                on_sent(i)
+    last_batch = {}  # グループ番号 -> 最後の embed を含むリクエストの番号
+    batches = pack_embeds(groups)
+    for b, batch in enumerate(batches):
+        for owner, _ in batch:
+            last_batch[owner] = b
+    for b, batch in enumerate(batches):
+        ok, err = send_webhook(webhook_url, embeds=[embed for _, embed in batch])
         if not ok:
             return False, err
+        if on_sent:
+            for owner in dict.fromkeys(owner for owner, _ in batch):
+                if last_batch[owner] == b:
+                    on_sent(owner)
     return True, None
 
 
+def send_30m(contents: list, on_sent=None):
+    """30分Bot用Webhook。1件1 embed とし、最大10件ずつまとめて送信。"""
+    url = DISCORD_WEBHOOK_URL_30M
+    if not url:
+        return False, "DISCORD_WEBHOOK_URL_30M が未設定です"
+    return send_packed(url, contents, on_sent=on_sent)
+
+
+def send_fanout(deliveries: dict, on_sent=None):
+    """
+    {webhook_url: [text, ...]} を Webhook ごとに並列送信。
+    Webhook ごとに順に送り、レート制限の待機もその Webhook 内で完結するため、
+    遅い・制限中のチャンネルが他のチャンネルの送信を待たせない。
+    on_sent が指定されていれば on_sent(webhook_url, i) を呼ぶ（別スレッドから呼ばれる）。
+    戻り値は {webhook_url: エラー文字列 または None}。
+    """
+    if not deliveries:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(deliveries), MAX_PARALLEL_WEBHOOKS)) as pool:
+        futures = {
+            url: pool.submit(
+                send_packed, url, contents,
+                on_sent=(lambda i, url=url: on_sent(url, i)) if on_sent else None,
+            )
+            for url, contents in deliveries.items()
+        }
+        return {url: f.result()[1] for url, f in futures.items()}
+
+
 def send_daily(content: str):
-    """日次まとめBot用Webhook。長文は分割送信。"""
+    """日次まとめBot用Webhook。長文は行単位で embed に詰めて送信。"""
     url = DISCORD_WEBHOOK_URL_DAILY
     if not url:
         return False, "DISCORD_WEBHOOK_URL_DAILY が未設定です"
-    # 2000文字超なら分割
-    chunk = 1900
-    for i in range(0, len(content), chunk):
-        part = content[i : i + chunk]
-        ok, err = send_webhook(url, content=part)
-        if not ok:
-            return False, err
-    return True, None
+    return send_packed(url, [content])
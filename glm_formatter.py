@@ -6,15 +6,76 @@ OpenAI互換の chat/completions エンドポイントを想定。
 無料モデル: glm-4-flash, glm-4.7-flash
 """
 import json
+import os
+import threading
 import time
 import urllib.request
 import urllib.error
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 
-from config import GLM_API_KEY, GLM_API_URL, GLM_MODEL
+from config import GLM_API_KEY, GLM_API_URL, GLM_MODEL, GLM_HEDGE_API_URL, GLM_HEDGE_MODEL
+from profiling import span
 
 # レート制限対策：APIコール間の待機時間（秒）
 API_CALL_DELAY = 2
 
+# 締め切りまでの残りがこれ未満なら GLM を呼ばずに未翻訳のまま返す（秒）
+GLM_MIN_CALL_SECONDS = float(os.environ.get("GLM_MIN_CALL_SECONDS", "10"))
+# ヘッジ: 1本目が直近の p90 レイテンシを超えても返らなければ2本目を送り、先に返った方を使う
+GLM_HEDGE = os.environ.get("GLM_HEDGE", "1").strip().lower() in ("1", "true", "yes")
+# p90 を計算できるだけの実績がないときのヘッジ開始までの秒数
+GLM_HEDGE_INITIAL_DELAY = float(os.environ.get("GLM_HEDGE_INITIAL_DELAY", "15"))
+GLM_HEDGE_MIN_SAMPLES = 5
+
+_deadline = None  # 実行全体の締め切り（time.monotonic() 基準。None なら無制限）
+_latencies = deque(maxlen=50)  # 成功したリクエストの所要時間（秒）
+_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "deadline_skips": 0, "deadline_timeouts": 0}
+
+# 速報の翻訳・分析結果のキャッシュ（同じタイトルの再翻訳を避け、英日の重複判定にも使う）
+GLM_CACHE_FILE = os.environ.get("GLM_CACHE_FILE", ".cache/glm_translations.json")
+GLM_CACHE_MAX = 500
+_translation_cache = None
+
+
+def _get_translation_cache():
+    global _translation_cache
+    if _translation_cache is None:
+        _translation_cache = {}
+        if GLM_CACHE_FILE and os.path.exists(GLM_CACHE_FILE):
+            try:
+                with open(GLM_CACHE_FILE, "r", encoding="utf-8") as f:
+                    _translation_cache = json.load(f)
+            except (OSError, ValueError):
+                _translation_cache = {}
+    return _translation_cache
+
+
+def get_cached_translation(title):
+    """translate_title_and_summary のキャッシュ済み結果（なければ None）"""
+    if not title:
+        return None
+    return _get_translation_cache().get(title)
+
+
+def _store_translation(title, result):
+    """翻訳結果をキャッシュに追加し、古いものから GLM_CACHE_MAX 件に刈り込んで保存。"""
+    cache = _get_translation_cache()
+    cache.pop(title, None)
+    cache[title] = result
+    for old in list(cache)[:-GLM_CACHE_MAX]:
+        del cache[old]
+    if not GLM_CACHE_FILE:
+        return
+    try:
+        os.makedirs(os.path.dirname(GLM_CACHE_FILE) or ".", exist_ok=True)
+        tmp = GLM_CACHE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp, GLM_CACHE_FILE)
+    except OSError as e:
+        print(f"[GLM] キャッシュ保存に失敗: {e}")
+
 
 def _is_mostly_english(text):
     """テキストが主に英語かどうかを判定（ASCII文字の割合で簡易判定）"""
@@ -25,8 +86,119 @@ def _is_mostly_english(text):
     return ratio > 0.7  # 70%以上がASCIIなら英語と判定
 
 
+def set_deadline(seconds):
+    """
+    これ以降の GLM 呼び出しの締め切りを「今から seconds 秒後」に設定（None または 0 以下で解除）。
+    各リクエストのタイムアウト・リトライ待ちは残り時間に収まるよう短縮される。
+    """
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+
+def remaining_seconds():
+    """締め切りまでの残り秒数（締め切りなしなら None）"""
+    if _deadline is None:
+        return None
+    return _deadline - time.monotonic()
+
+
+def glm_stats():
+    """リクエスト数（ヘッジ分を含む実際の送信数）・ヘッジ数・ヘッジ勝ち数・締め切りによるスキップ/タイムアウト数"""
+    return dict(_stats)
+
+
+def format_glm_stats():
+    s = _stats
+    win_rate = f"{s['hedge_wins'] / s['hedged'] * 100:.0f}%" if s["hedged"] else "-"
+    return (f"リクエスト {s['requests']}件（うちヘッジ {s['hedged']}件・勝率 {win_rate}）, "
+            f"締め切りでスキップ {s['deadline_skips']}件・打ち切り {s['deadline_timeouts']}件")
+
+
+def _hedge_delay():
+    """ヘッジを送るまでの待ち時間（直近の成功レイテンシの p90）"""
+    if len(_latencies) < GLM_HEDGE_MIN_SAMPLES:
+        return GLM_HEDGE_INITIAL_DELAY
+    ordered = sorted(_latencies)
+    return ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)]
+
+
+def _post_glm(url, model, body, timeout):
+    """1回分のリクエストを送り、レスポンス本文を返す（失敗時は例外）"""
+    data = json.dumps(dict(body, model=model or "glm-4-flash")).encode("utf-8")
+    req = urllib.request.Request(
+        url,
+        data=data,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {GLM_API_KEY}",
+        },
+        method="POST",
+    )
+    started = time.monotonic()
+    with span("glm_request"), urllib.request.urlopen(req, timeout=timeout) as res:
+        raw_response = res.read().decode()
+    _latencies.append(time.monotonic() - started)
+    return raw_response
+
+
+def _start_request(url, model, body, timeout):
+    """
+    専用のデーモンスレッドで1回分のリクエストを送る。
+    プールのキュー待ちがないためタイムアウトは呼び出した時点から数えられ、
+    負けた側のリクエストが残っていてもプロセスの終了を待たせない。
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_post_glm(url, model, body, timeout))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="glm-request", daemon=True).start()
+    return future
+
+
+def _request_with_hedge(body, timeout):
+    """
+    1本目を送り、p90 を超えても返らなければ2本目（GLM_HEDGE_MODEL / GLM_HEDGE_API_URL）を送る。
+    先に成功した方のレスポンスを返す。待つのは1本目の送信から timeout 秒まで（超えたら TimeoutError）。
+    両方失敗したら1本目の例外を送出。
+    """
+    _stats["requests"] += 1
+    started = time.monotonic()
+    primary = _start_request(GLM_API_URL, GLM_MODEL, body, timeout)
+    pending = {primary}
+    delay = _hedge_delay()
+    if GLM_HEDGE and delay < timeout:
+        done, _ = wait(pending, timeout=delay)
+        if not done:
+            print(f"[GLM] {delay:.1f}秒経過しても応答がないためヘッジを送信 (model={GLM_HEDGE_MODEL})")
+            _stats["hedged"] += 1
+            _stats["requests"] += 1  # ヘッジも実際に送ったリクエストとして数える（予算の計算に使われる）
+            hedge = _start_request(GLM_HEDGE_API_URL, GLM_HEDGE_MODEL, body, timeout - (time.monotonic() - started))
+            pending.add(hedge)
+    while pending:
+        left = timeout - (time.monotonic() - started)
+        if left <= 0:
+            break
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    _stats["hedge_wins"] += 1
+                    print("[GLM] ヘッジ側の応答を使用")
+                return future.result()
+    if not pending and primary.exception() is not None:
+        raise primary.exception()
+    raise TimeoutError(f"{timeout:.0f}秒以内に応答がありませんでした")
+
+
 def _call_glm(system_prompt, user_prompt, max_tokens=256):
-    """GLM API を呼び出す共通関数（リトライ付き）"""
+    """
+    GLM API を呼び出す共通関数（リトライ・ヘッジ付き）。
+    set_deadline の締め切りに間に合わない場合は呼び出さずに None を返す（呼び出し側は未翻訳で送る）。
+    """
     if not GLM_API_KEY:
         print("[GLM] API Key が未設定です")
         return None
@@ -37,7 +209,6 @@ def _call_glm(system_prompt, user_prompt, max_tokens=256):
     print(f"[GLM] リクエスト送信中... (model={GLM_MODEL}, url={GLM_API_URL[:50]}...)")
 
     body = {
-        "model": GLM_MODEL or "glm-4-flash",
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
@@ -45,94 +216,94 @@ def _call_glm(system_prompt, user_prompt, max_tokens=256):
         "max_tokens": max_tokens,
         "temperature": 0.3,  # 一貫性のある翻訳のため低めに設定
     }
-    data = json.dumps(body).encode("utf-8")
 
     max_retries = 3
     timeout_seconds = [30, 60, 90]  # リトライごとにタイムアウトを延長
 
     for attempt in range(max_retries):
-        req = urllib.request.Request(
-            GLM_API_URL,
-            data=data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {GLM_API_KEY}",
-            },
-            method="POST",
-        )
+        backoff = 3 * attempt  # リトライ前に待機（3秒, 6秒）
         current_timeout = timeout_seconds[attempt]
+        remaining = remaining_seconds()
+        if remaining is not None:
+            # 締め切りに収まるようにタイムアウトを短縮。収まらなければ即座に諦める
+            if remaining - backoff < GLM_MIN_CALL_SECONDS:
+                _stats["deadline_skips"] += 1
+                print(f"[GLM] 締め切りまで残り{max(remaining, 0):.0f}秒のため呼び出しをスキップ")
+                return None
+            current_timeout = min(current_timeout, remaining - backoff)
         try:
             if attempt > 0:
-                wait = 3 * attempt  # リトライ前に待機（3秒, 6秒）
-                print(f"[GLM] {wait}秒待機後にリトライ ({attempt + 1}/{max_retries}, timeout={current_timeout}s)...")
-                time.sleep(wait)
-            with urllib.request.urlopen(req, timeout=current_timeout) as res:
-                raw_response = res.read().decode()
-                print(f"[GLM] APIレスポンス全体: {raw_response[:500]}...")
-                out = json.loads(raw_response)
-                choices = out.get("choices") or []
-                if not choices:
-                    print(f"[GLM] 警告: choicesが空です")
-                    return None
-
-                message = choices[0].get("message", {})
-                # content または reasoning_content から結果を取得
-                content = message.get("content", "")
-                reasoning = message.get("reasoning_content", "")
-
-                print(f"[GLM] content: {content[:100] if content else '(空)'}")
-                print(f"[GLM] reasoning_content: {reasoning[:100] if reasoning else '(空)'}")
-
-                # reasoning_content に翻訳結果がある場合、最後の翻訳結果を抽出
-                if not content and reasoning:
-                    import re
-                    # 1. 「出力:」の後の部分を優先的に抽出（最後に出現するものを取得）
-                    matches = list(re.finditer(r'出力[：:]\s*(.+?)(?:\n|$)', reasoning, re.IGNORECASE | re.MULTILINE))
-                    if matches:
-                        # 最後の「出力:」を使用
-                        content = matches[-1].group(1).strip()
-                        print(f"[GLM] reasoning_contentから「出力:」パターンで抽出: {content[:50]}...")
-
-                    # 2. 見つからない場合、日本語を含む行を探す（英語の説明行を除外）
-                    if not content:
-                        lines = reasoning.strip().split('\n')
-                        for line in lines:
-                            line = line.strip()
-                            # 日本語（ひらがな・カタカナ・漢字）を含み、英語の説明行でない行を探す
-                            if line and any('\u3040' <= c <= '\u309F' or '\u30A0' <= c <= '\u30FF' or '\u4E00' <= c <= '\u9FFF' for c in line):
-                                # 英語のマークダウンやリスト記号、説明文を除外
-                                if not re.match(r'^\d+\.\s+\*\*', line) and not line.startswith('*') and not line.startswith('#'):
-                                    content = line
-                                    print(f"[GLM] reasoning_contentから日本語行を抽出: {content[:50]}...")
-                                    break
-
-                    # 3. それでも見つからない場合、「翻訳:」や「Translation:」パターンを探す
-                    if not content:
-                        match = re.search(r'(?:翻訳|Translation|Result)[：:]\s*(.+)', reasoning, re.IGNORECASE)
-                        if match:
-                            content = match.group(1).strip()
-                            print(f"[GLM] reasoning_contentから「翻訳:」パターンで抽出: {content[:50]}...")
-
-                print(f"[GLM] 最終的な翻訳結果 (content長さ: {len(content)}): {content[:100] if content else '(なし)'}...")
-
-                # 空レスポンス（finish_reason: "abort" 等）の場合はリトライ
-                if not content.strip():
-                    finish_reason = choices[0].get("finish_reason", "unknown")
-                    print(f"[GLM] 空レスポンス (finish_reason={finish_reason}, 試行 {attempt + 1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        continue  # リトライ
-                    print(f"[GLM] 全{max_retries}回の試行で有効な応答を得られませんでした")
-                    return None
-
-                # レート制限対策：次のAPIコールまで待機
-                time.sleep(API_CALL_DELAY)
-                return content.strip()
+                print(f"[GLM] {backoff}秒待機後にリトライ ({attempt + 1}/{max_retries}, timeout={current_timeout:.0f}s)...")
+                time.sleep(backoff)
+            raw_response = _request_with_hedge(body, current_timeout)
+            print(f"[GLM] APIレスポンス全体: {raw_response[:500]}...")
+            out = json.loads(raw_response)
+            choices = out.get("choices") or []
+            if not choices:
+                print(f"[GLM] 警告: choicesが空です")
+                return None
+
+            message = choices[0].get("message", {})
+            # content または reasoning_content から結果を取得
+            content = message.get("content", "")
+            reasoning = message.get("reasoning_content", "")
+
+            print(f"[GLM] content: {content[:100] if content else '(空)'}")
+            print(f"[GLM] reasoning_content: {reasoning[:100] if reasoning else '(空)'}")
+
+            # reasoning_content に翻訳結果がある場合、最後の翻訳結果を抽出
+            if not content and reasoning:
+                import re
+                # 1. 「出力:」の後の部分を優先的に抽出（最後に出現するものを取得）
+                matches = list(re.finditer(r'出力[：:]\s*(.+?)(?:\n|$)', reasoning, re.IGNORECASE | re.MULTILINE))
+                if matches:
+                    # 最後の「出力:」を使用
+                    content = matches[-1].group(1).strip()
+                    print(f"[GLM] reasoning_contentから「出力:」パターンで抽出: {content[:50]}...")
+
+                # 2. 見つからない場合、日本語を含む行を探す（英語の説明行を除外）
+                if not content:
+                    lines = reasoning.strip().split('\n')
+                    for line in lines:
+                        line = line.strip()
+                        # 日本語（ひらがな・カタカナ・漢字）を含み、英語の説明行でない行を探す
+                        if line and any('\u3040' <= c <= '\u309F' or '\u30A0' <= c <= '\u30FF' or '\u4E00' <= c <= '\u9FFF' for c in line):
+                            # 英語のマークダウンやリスト記号、説明文を除外
+                            if not re.match(r'^\d+\.\s+\*\*', line) and not line.startswith('*') and not line.startswith('#'):
+                                content = line
+                                print(f"[GLM] reasoning_contentから日本語行を抽出: {content[:50]}...")
+                                break
+
+                # 3. それでも見つからない場合、「翻訳:」や「Translation:」パターンを探す
+                if not content:
+                    match = re.search(r'(?:翻訳|Translation|Result)[：:]\s*(.+)', reasoning, re.IGNORECASE)
+                    if match:
+                        content = match.group(1).strip()
+                        print(f"[GLM] reasoning_contentから「翻訳:」パターンで抽出: {content[:50]}...")
+
+            print(f"[GLM] 最終的な翻訳結果 (content長さ: {len(content)}): {content[:100] if content else '(なし)'}...")
+
+            # 空レスポンス（finish_reason: "abort" 等）の場合はリトライ
+            if not content.strip():
+                finish_reason = choices[0].get("finish_reason", "unknown")
+                print(f"[GLM] 空レスポンス (finish_reason={finish_reason}, 試行 {attempt + 1}/{max_retries})")
+                if attempt < max_retries - 1:
+                    continue  # リトライ
+                print(f"[GLM] 全{max_retries}回の試行で有効な応答を得られませんでした")
+                return None
+
+            # レート制限対策：次のAPIコールまで待機（締め切りを超えない範囲で）
+            remaining = remaining_seconds()
+            time.sleep(API_CALL_DELAY if remaining is None else max(min(API_CALL_DELAY, remaining), 0))
+            return content.strip()
         except urllib.error.HTTPError as e:
             error_body = e.read().decode()
             print(f"[GLM] HTTP エラー: {e.code} - {error_body[:300]}")
             return None
         except (TimeoutError, urllib.error.URLError, ConnectionError, OSError) as e:
             print(f"[GLM] タイムアウト/接続エラー (試行 {attempt + 1}/{max_retries}): {type(e).__name__}: {e}")
+            if current_timeout < timeout_seconds[attempt]:
+                _stats["deadline_timeouts"] += 1  # 締め切りで短縮したタイムアウトに間に合わなかった
             if attempt < max_retries - 1:
                 continue  # リトライ
             print(f"[GLM] 全{max_retries}回の試行が失敗しました")
@@ -181,6 +352,11 @@ def translate_title_and_summary(title, summary):
             'urgency': ''
         }
 
+    cached = get_cached_translation(title)
+    if cached:
+        print(f"[GLM] キャッシュ済みの翻訳を使用: {title[:50]}...")
+        return dict(cached)
+
     if not GLM_API_KEY:
         print(f"[GLM] API Key未設定のためスキップ")
         return {
@@ -210,6 +386,8 @@ def translate_title_and_summary(title, summary):
     impact_score = 0
     sentiment = ''
     urgency = ''
+    # 応答を解釈できたか（できたものだけキャッシュする。未翻訳の結果を使い回さないため）
+    parsed = False
 
     # 英語の場合は翻訳+分析、日本語の場合は分析のみ
     if is_english:
@@ -270,23 +448,25 @@ def translate_title_and_summary(title, summary):
 
     if result:
         # クリーンアップ: 不要なラベルやマークダウンを除去
-        import re
-        result = re.sub(r'^(?:出力|Output|翻訳|Translation)[：:]\s*', '', result, flags=re.IGNORECASE).strip()
-        # プレースホルダーを除去
-        result = re.sub(r'\[Japanese Translation\]', '', result, flags=re.IGNORECASE).strip()
-
-        # 各項目を正規表現で抽出
-        title_match = re.search(r'(?:タイトル|Title)[：:]\s*(.+?)(?:\n|$)', result, re.IGNORECASE | re.MULTILINE)
-        summary_match = re.search(r'(?:要約|Summary)[：:]\s*(.+?)(?:\n(?:コメント|Comment|影響度|センチメント|緊急度)|$)', result, re.IGNORECASE | re.MULTILINE | re.DOTALL)
-        comment_match = re.search(r'(?:コメント|Comment)[：:]\s*(.+?)(?:\n(?:影響度|センチメント|緊急度|タイトル|要約)|$)', result, re.IGNORECASE | re.MULTILINE | re.DOTALL)
-        impact_match = re.search(r'(?:影響度|Impact)[：:]\s*(\d+)', result, re.IGNORECASE)
-        sentiment_match = re.search(r'(?:センチメント|Sentiment)[：:]\s*(ポジティブ|中立|ネガティブ|Positive|Neutral|Negative)', result, re.IGNORECASE)
-        urgency_match = re.search(r'(?:緊急度|Urgency)[：:]\s*(高|中|低|High|Medium|Low)', result, re.IGNORECASE)
+        with span("glm_parse"):
+            import re
+            result = re.sub(r'^(?:出力|Output|翻訳|Translation)[：:]\s*', '', result, flags=re.IGNORECASE).strip()
+            # プレースホルダーを除去
+            result = re.sub(r'\[Japanese Translation\]', '', result, flags=re.IGNORECASE).strip()
+
+            # 各項目を正規表現で抽出
+            title_match = re.search(r'(?:タイトル|Title)[：:]\s*(.+?)(?:\n|$)', result, re.IGNORECASE | re.MULTILINE)
+            summary_match = re.search(r'(?:要約|Summary)[：:]\s*(.+?)(?:\n(?:コメント|Comment|影響度|センチメント|緊急度)|$)', result, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+            comment_match = re.search(r'(?:コメント|Comment)[：:]\s*(.+?)(?:\n(?:影響度|センチメント|緊急度|タイトル|要約)|$)', result, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+            impact_match = re.search(r'(?:影響度|Impact)[：:]\s*(\d+)', result, re.IGNORECASE)
+            sentiment_match = re.search(r'(?:センチメント|Sentiment)[：:]\s*(ポジティブ|中立|ネガティブ|Positive|Neutral|Negative)', result, re.IGNORECASE)
+            urgency_match = re.search(r'(?:緊急度|Urgency)[：:]\s*(高|中|低|High|Medium|Low)', result, re.IGNORECASE)
 
         # 英語ニュースの場合のみタイトル・要約を更新
         if is_english:
             if title_match:
                 translated_title = title_match.group(1).strip().strip('"\'')
+                parsed = True
                 print(f"[GLM] ✓ タイトル翻訳成功: {title[:40]}... → {translated_title[:40]}...")
 
             if summary_match and summary:
@@ -331,6 +511,10 @@ def translate_title_and_summary(title, summary):
             urgency = urgency_map.get(urgency_raw.lower(), urgency_raw)
             print(f"[GLM] ✓ 緊急度: {urgency}")
 
+        # 日本語ニュースは分析（コメント・影響度・センチメント）が1つでも取れれば成功
+        if not is_english and (comment_match or impact_match or sentiment_match):
+            parsed = True
+
         # 英語ニュースでパターンが見つからない場合のフォールバック処理
         if is_english and not title_match and not summary_match:
             # 複数行の場合は日本語を含む最初の行を使用
@@ -355,13 +539,14 @@ def translate_title_and_summary(title, summary):
                               for c in result)
             if has_japanese and len(result) > 3:  # 短すぎる結果を除外
                 translated_title = result
+                parsed = True
                 print(f"[GLM] ✓ タイトル翻訳成功: {title[:40]}... → {translated_title[:40]}...")
             else:
                 print(f"[GLM] ✗ 警告: 翻訳結果が日本語でないか短すぎる: '{result}'")
     else:
         print(f"[GLM] ✗ 翻訳失敗: resultがNone")
 
-    return {
+    translated = {
         'title': translated_title,
         'summary': translated_summary,
         'comment': comment,
@@ -369,6 +554,9 @@ def translate_title_and_summary(title, summary):
         'sentiment': sentiment,
         'urgency': urgency
     }
+    if parsed:
+        _store_translation(title, translated)
+    return translated
 
 
 def format_news_with_glm(news_items: list, max_items=50) -> str:
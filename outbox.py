@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+送信前のメッセージを保存しておくアウトボックス（30分Bot用）
+GLM整形済みのメッセージを送信前にディスクへ書き、送信成功ごとに ack を追記する。
+途中で失敗・中断しても、次回の実行で未 ack のものだけを再送する（再取得・再翻訳しない）。
+ファイル形式は JSON Lines の追記ログ:
+  {"op": "add", "id", "route", "link", "content", "added"} / {"op": "ack", "id"} / {"op": "fail", "id"}
+同じ記事でも送信先（route）ごとに別のメッセージとして扱う。
+追加から OUTBOX_MAX_AGE_HOURS を過ぎたもの、OUTBOX_MAX_ATTEMPTS 回の実行で送れなかったものは
+再送せずに捨てる（古い速報や、止まった Webhook 宛ての分を持ち越し続けないため）。
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+# 未送信のまま再送を続ける最大時間（時間）。見送り分（load_deferred）と同じ 6 時間
+OUTBOX_MAX_AGE_HOURS = float(os.environ.get("OUTBOX_MAX_AGE_HOURS", "6"))
+# 送信に失敗した実行がこの回数に達したら捨てる
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "3"))
+
+
+class Outbox:
+    def __init__(self, filepath, max_age_hours=OUTBOX_MAX_AGE_HOURS, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.filepath = filepath
+        self.max_age_hours = max_age_hours
+        self.max_attempts = max_attempts
+        self._records = {}  # id -> record（追加順）
+        self._acked = set()
+        self._lock = threading.Lock()  # 並列送信時に複数スレッドから ack される
+        self._load()
+
+    def _load(self):
+        if not self.filepath or not os.path.exists(self.filepath):
+            return
+        loaded = time.time()
+        with open(self.filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    continue  # 書き込み途中で中断された行は無視
+                if op.get("op") == "add":
+                    record = {k: op.get(k, "") for k in ("id", "route", "link", "content")}
+                    record["route"] = record["route"] or "default"  # 送信先を持たない旧形式
+                    record["added"] = op.get("added") or loaded  # 追加時刻を持たない旧形式は読み込み時刻から数える
+                    record["attempts"] = op.get("attempts") or 0
+                    self._records[op["id"]] = record
+                    self._acked.discard(op["id"])
+                elif op.get("op") == "ack":
+                    self._acked.add(op["id"])
+                elif op.get("op") == "fail" and op.get("id") in self._records:
+                    self._records[op["id"]]["attempts"] += 1
+
+    def _append(self, ops):
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        with open(self.filepath, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, records):
+        """送信前のメッセージ [{"id", "route", "link", "content"}, ...] を保存（追加時刻を付ける）"""
+        if not records:
+            return
+        now = time.time()
+        records = [dict(r, added=now, attempts=0) for r in records]
+        self._append([dict(r, op="add") for r in records])
+        for r in records:
+            self._records[r["id"]] = r
+            self._acked.discard(r["id"])
+
+    def ack(self, record_id):
+        """送信成功を記録"""
+        with self._lock:
+            self._append([{"op": "ack", "id": record_id}])
+            self._acked.add(record_id)
+
+    def mark_failed(self, record_ids):
+        """送信を試みて ack されなかったメッセージの失敗回数を1増やす（ack 済みは無視）"""
+        with self._lock:
+            failed = [rid for rid in record_ids if rid in self._records and rid not in self._acked]
+            if not failed:
+                return
+            self._append([{"op": "fail", "id": rid} for rid in failed])
+            for rid in failed:
+                self._records[rid]["attempts"] += 1
+
+    def _drop_reason(self, record):
+        """再送せずに捨てる理由（捨てないなら空文字）"""
+        if self.max_age_hours > 0 and record["added"] < time.time() - self.max_age_hours * 3600:
+            return f"未送信のまま {self.max_age_hours:g} 時間を過ぎた"
+        if self.max_attempts > 0 and record["attempts"] >= self.max_attempts:
+            return f"送信に {record['attempts']} 回失敗した"
+        return ""
+
+    def pending(self):
+        """未送信で、期限・失敗回数の上限に達していないメッセージ（追加順）"""
+        return [r for rid, r in self._records.items() if rid not in self._acked and not self._drop_reason(r)]
+
+    def acked_links(self):
+        """送信済みの記事リンク（送信先が複数あっても1回だけ）"""
+        return list(dict.fromkeys(r["link"] for rid, r in self._records.items() if rid in self._acked))
+
+    def compact(self):
+        """ack 済み・期限切れ・失敗回数超過の記録を捨て、未送信分だけでファイルを書き直す。"""
+        for rid, r in self._records.items():
+            reason = "" if rid in self._acked else self._drop_reason(r)
+            if reason:
+                print(f"[WARN] {reason}ため破棄: {r['route']}: {r['link']}", file=sys.stderr)
+        pending = self.pending()
+        if not self._records and not os.path.exists(self.filepath):
+            return
+        tmp = self.filepath + ".tmp"
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            for r in pending:
+                f.write(json.dumps(dict(r, op="add"), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filepath)
+        self._records = {r["id"]: r for r in pending}
+        self._acked = set()
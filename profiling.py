@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+実行プロファイル（エントリポイントに --profile を付けるか BOT_PROFILE=1 で有効）
+cProfile・tracemalloc と、取得・フィルタ・GLM・送信などの区間計測（span）を記録し、
+PROFILE_DIR（デフォルト .profile）に .prof（pstats 形式）と集計レポート .txt を書き出す。
+無効時は span() が共有の nullcontext を返すだけで、計測は一切行わない。
+"""
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".profile")
+# レポートに載せる関数・割り当て箇所の件数
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "30"))
+
+_NULL_SPAN = contextlib.nullcontext()
+_spans = None  # 有効時のみ {name: [回数, 合計秒]}
+_lock = threading.Lock()  # span はフィード取得・送信のワーカースレッドからも記録される
+
+
+def is_enabled(argv=None):
+    """--profile 引数 または BOT_PROFILE 環境変数で有効か"""
+    argv = sys.argv if argv is None else argv
+    if "--profile" in argv:
+        return True
+    return os.environ.get("BOT_PROFILE", "").strip().lower() in ("1", "true", "yes")
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        spans = _spans
+        if spans is not None:
+            with _lock:
+                record = spans.setdefault(self.name, [0, 0.0])
+                record[0] += 1
+                record[1] += elapsed
+        return False
+
+
+def span(name):
+    """名前付き区間の計測（with span("fetch"): ...）。プロファイル無効時は何もしない。"""
+    if _spans is None:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+@contextlib.contextmanager
+def profile_run(name, enabled=None):
+    """
+    実行全体を cProfile・tracemalloc で包み、終了時（sys.exit を含む）にレポートを書き出す。
+    enabled を省略すると is_enabled() で判定。
+    """
+    global _spans
+    if enabled is None:
+        enabled = is_enabled()
+    if not enabled:
+        yield
+        return
+    _spans = {}
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        spans, _spans = _spans, None
+        _write_report(name, profiler, snapshot, peak, spans, wall)
+
+
+def _write_report(name, profiler, snapshot, peak, spans, wall):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    base = os.path.join(PROFILE_DIR, f"{name}-{stamp}")
+    profiler.dump_stats(base + ".prof")
+
+    out = io.StringIO()
+    out.write(f"# {name} プロファイル ({stamp} UTC)\n")
+    out.write(f"経過時間: {wall:.2f}s / メモリ割り当てピーク: {peak / 1024:.1f} KiB\n\n")
+
+    out.write("## 区間（span）\n")
+    out.write("※ download・feedparser・glm_request・send_webhook はワーカースレッドでの合計"
+              "（並列のため経過時間を超えうる。関数別の集計には含まれない）\n")
+    for span_name, (count, total) in sorted(spans.items(), key=lambda kv: kv[1][1], reverse=True):
+        out.write(f"{span_name:<16} {total:9.3f}s  {count:5d}回  平均 {total / count * 1000:9.1f}ms\n")
+
+    out.write(f"\n## 関数（累積時間 上位{PROFILE_TOP_N}件・メインスレッドのみ）\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+
+    out.write(f"\n## メモリ割り当て（上位{PROFILE_TOP_N}件）\n")
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+        out.write(f"{stat}\n")
+
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    print(f"[PROFILE] {base}.prof / {base}.txt を出力しました")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+30分Botの振り分けルール（DISCORD_ROUTES）の読み込みと判定
+ソース種別・キーワード・影響度・言語で、記事ごとに送信先の Webhook を決める。
+"""
+import json
+import sys
+
+from config import DISCORD_ROUTES, DISCORD_WEBHOOK_URL_30M
+from rss_fetcher import _is_crypto_media
+from glm_formatter import _is_mostly_english
+
+
+def load_routes():
+    """
+    ルール一覧を返す。DISCORD_ROUTES が未設定・不正なら DISCORD_WEBHOOK_URL_30M への全件送信のみ。
+    """
+    routes = []
+    if DISCORD_ROUTES:
+        try:
+            raw = json.loads(DISCORD_ROUTES)
+        except ValueError as e:
+            print(f"[ROUTE] DISCORD_ROUTES の JSON が不正です: {e}", file=sys.stderr)
+            raw = []
+        for i, r in enumerate(raw):
+            if not isinstance(r, dict) or not (r.get("webhook") or "").strip():
+                print(f"[ROUTE] webhook のないルールを無視します: {r}", file=sys.stderr)
+                continue
+            route = dict(r)
+            route["name"] = str(r.get("name") or f"route{i + 1}")
+            route["webhook"] = r["webhook"].strip()
+            routes.append(route)
+    if not routes and DISCORD_WEBHOOK_URL_30M:
+        routes.append({"name": "default", "webhook": DISCORD_WEBHOOK_URL_30M})
+    return routes
+
+
+def describe_item(entry, title, impact_score=0):
+    """ルール判定に使う記事の属性（title は翻訳後のものがあれば併用する）"""
+    original = entry.title or ""
+    return {
+        "source": "crypto" if _is_crypto_media(getattr(entry, '_source_url', '')) else "general",
+        "language": "en" if _is_mostly_english(original) else "ja",
+        "text": f"{original}\n{title}".lower(),
+        "impact_score": impact_score,
+    }
+
+
+def route_matches(route, item, prefilter=False):
+    """
+    item（describe_item の戻り値）が route の条件をすべて満たすか。
+    prefilter=True ならソース・言語だけを見る（GLM 前の事前判定用。
+    キーワードは翻訳後に当たることがあり、影響度は GLM の結果次第のため）。
+    """
+    if route.get("source") and route["source"] != item["source"]:
+        return False
+    if route.get("language") and route["language"] != item["language"]:
+        return False
+    if prefilter:
+        return True
+    keywords = route.get("keywords") or []
+    if keywords and not any(k.lower() in item["text"] for k in keywords):
+        return False
+    if item["impact_score"] < int(route.get("min_impact") or 0):
+        return False
+    return True
+
+
+def match_routes(routes, item, prefilter=False):
+    """条件を満たすルール名の一覧"""
+    return [r["name"] for r in routes if route_matches(r, item, prefilter=prefilter)]
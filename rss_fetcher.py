@@ -2,10 +2,19 @@
 """
 RSS取得・フィルタの共通ロジック（30分Bot・日次まとめBotで共用）
 """
-import feedparser
+import heapq
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
+import feedparser
+
 from config import RSS_URLS, IMPORTANT_KEYWORDS, CRYPTO_MEDIA_KEYWORDS
+from profiling import span
+
+# フィードの同時取得数と、1フィードの取得タイムアウト（秒）
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
 
 
 def _parse_published(entry):
@@ -63,38 +72,91 @@ def _is_similar(t1, t2):
     return (t1[:20] in t2 or t2[:20] in t1) if len(t1) >= 20 and len(t2) >= 20 else (t1 == t2)
 
 
-def get_news(minutes=None, hours=None, dedup=True):
+def _fetch_feed(url):
     """
-    RSSからニュースを取得。
-    minutes: 過去N分以内に限定（指定しない場合は時間フィルタなし）
-    hours: 過去N時間以内に限定（minutes より優先されない。minutes/hours のどちらか指定）
+    フィードを取得して解析する。ダウンロード（ネットワーク待ち）と feedparser の解析を
+    別の区間として計測するため、取得は urllib で行い、解析には本文を渡す。
+    """
+    req = urllib.request.Request(url, headers={"User-Agent": "Crypto-News-Alert-Bot/1.0 (GitHub Actions)"})
+    with span("download"), urllib.request.urlopen(req, timeout=FETCH_TIMEOUT) as res:
+        data = res.read()
+        headers = {
+            "content-type": res.headers.get("Content-Type", ""),
+            "content-location": res.geturl(),
+        }
+    with span("feedparser"):
+        return feedparser.parse(data, response_headers=headers)
+
+
+def _iter_feed(future, url):
+    """
+    1フィード分のエントリを (公開日時, 順番, entry) で新しい順に返す。
+    取得・解析の失敗はそのフィードだけを空として扱う。
+    """
+    try:
+        feed = future.result()
+        # 日時は1回だけ解析する。多くのフィードは新しい順なのでソートはほぼ線形
+        with span("parse_dates"):
+            stamped = sorted(
+                ((_parse_published(entry), i, entry) for i, entry in enumerate(feed.entries)),
+                key=lambda t: t[0],
+                reverse=True,
+            )
+        for _, _, entry in stamped:
+            # <title> / <link> のない項目でも後段が entry.title / entry.link で参照できるように
+            entry.setdefault("title", "")
+            entry.setdefault("link", "")
+            entry._source_url = url  # ソースURLを記録
+    except Exception:
+        return
+    yield from stamped
+
+
+def iter_news(minutes=None, hours=None, dedup=True):
+    """
+    RSSからニュースを新しい順に1件ずつ返すジェネレータ。
+    各フィードを並列に取得し、フィードごとの新しい順の列を heapq.merge で k-way マージする。
+    マージは全フィードの先頭を比べるため、最初の1件が出るのは全フィードの取得後
+    （並列取得なので待ち時間は最も遅いフィード1本分）。重複除去などの後段はそこから逐次処理される。
+    minutes / hours の範囲より古いエントリに達した時点で全体を打ち切る（残りはすべて古いため）。
+    1件の処理で例外が起きてもそのエントリを飛ばすだけで、全体は止めない。
     dedup: タイトルで重複除去
     各 entry に _source_url 属性を付与（フィルタ判定用）
     """
-    seen_titles = []
-    entries = []
     now = datetime.now(timezone.utc)
+    cutoffs = []
+    if minutes is not None:
+        cutoffs.append(now - timedelta(minutes=minutes))
+    if hours is not None:
+        cutoffs.append(now - timedelta(hours=hours))
+    cutoff = max(cutoffs) if cutoffs else None
 
-    for url in RSS_URLS:
-        try:
-            feed = feedparser.parse(url)
-            for entry in feed.entries:
-                published = _parse_published(entry)
-                if minutes is not None and (now - published).total_seconds() > minutes * 60:
-                    continue
-                if hours is not None and (now - published).total_seconds() > hours * 3600:
-                    continue
+    seen_titles = []
+    pool = ThreadPoolExecutor(max_workers=min(len(RSS_URLS), FETCH_WORKERS) or 1)
+    try:
+        futures = [(pool.submit(_fetch_feed, url), url) for url in RSS_URLS]
+        streams = [_iter_feed(future, url) for future, url in futures]
+        for published, _, entry in heapq.merge(*streams, key=lambda t: t[0], reverse=True):
+            if cutoff is not None and published < cutoff:
+                break
+            try:
                 if dedup and any(_is_similar(entry.title, t) for t in seen_titles):
                     continue
-                entry._source_url = url  # ソースURLを記録
-                entries.append(entry)
                 seen_titles.append(entry.title or "")
-        except Exception:
-            continue
+            except Exception:
+                continue
+            yield entry
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 
-    # 新しい順
-    entries.sort(key=lambda e: _parse_published(e), reverse=True)
-    return entries
+def get_news(minutes=None, hours=None, dedup=True):
+    """
+    RSSからニュースを取得（新しい順のリスト）。iter_news の結果をまとめて返す。
+    minutes: 過去N分以内に限定（指定しない場合は時間フィルタなし）
+    hours: 過去N時間以内に限定（minutes / hours の両方を指定した場合は狭い方）
+    """
+    return list(iter_news(minutes=minutes, hours=hours, dedup=dedup))
 
 
 def get_recent_news_30m(important_only=False):
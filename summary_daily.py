@@ -10,7 +10,11 @@ import sys
 from config import DISCORD_WEBHOOK_URL_DAILY, USE_GLM_FOR_DAILY
 from rss_fetcher import get_daily_news
 from discord_webhook import send_daily
-from glm_formatter import format_news_with_glm
+from glm_formatter import format_news_with_glm, set_deadline, format_glm_stats
+from profiling import profile_run, span
+
+# GLM 処理時間の上限（秒、0=無制限）。各呼び出しのタイムアウトもこの締め切りに収まるよう短縮する
+MAX_SECONDS = int(os.environ.get("DAILY_SUMMARY_MAX_SECONDS", "600"))
 
 
 def main():
@@ -19,7 +23,8 @@ def main():
         sys.exit(1)
 
     hours = int(os.environ.get("DAILY_SUMMARY_HOURS", "24"))
-    items = get_daily_news(hours=hours)
+    with span("fetch"):
+        items = get_daily_news(hours=hours)
     if not items:
         body = "📢 **本日のニュースまとめ**\n\n過去{}時間のニュースはありません。".format(hours)
         send_daily(body)
@@ -28,9 +33,13 @@ def main():
 
     # 整形: GLM を使う場合
     if USE_GLM_FOR_DAILY:
-        formatted = format_news_with_glm(
-            [{"title": e.title, "link": e.link} for e in items]
-        )
+        # 間に合わなければプレーン一覧で送る
+        set_deadline(MAX_SECONDS)
+        with span("enrich"):
+            formatted = format_news_with_glm(
+                [{"title": e.title, "link": e.link} for e in items]
+            )
+        print(f"[INFO] GLM: {format_glm_stats()}")
         if formatted:
             body = "📢 **本日のニュースまとめ**（GLM整形）\n\n" + formatted
         else:
@@ -44,7 +53,8 @@ def main():
             lines.append("• {}\n  <{}>".format(e.title, e.link))
         body = "\n".join(lines)
 
-    ok, err = send_daily(body)
+    with span("send"):
+        ok, err = send_daily(body)
     if not ok:
         print("送信失敗:", err, file=sys.stderr)
         sys.exit(1)
@@ -52,4 +62,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # --profile または BOT_PROFILE=1 でプロファイルを .profile/ に出力
+    with profile_run("summary_daily"):
+        main()